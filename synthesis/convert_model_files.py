@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 oatsu
+"""
+学習済みモデルのファイルを、合成時に速く読み込める形式に変換する。
+    - チェックポイント (*.pth) -> *.safetensors
+    - スケーラー (*.joblib) -> *.npz
+変換後のファイルは元のファイルと同じフォルダに出力する。
+"""
+from glob import glob
+from os.path import join, splitext
+
+import joblib
+import numpy as np
+import torch
+from safetensors.torch import save_file
+
+
+def convert_checkpoint(path_pth: str) -> str:
+    """
+    チェックポイントの state_dict だけを safetensors 形式で保存する。
+    """
+    checkpoint = torch.load(path_pth, map_location='cpu')
+    state_dict = {k: v.contiguous() for k, v in checkpoint['state_dict'].items()}
+    path_out = splitext(path_pth)[0] + '.safetensors'
+    save_file(state_dict, path_out)
+    return path_out
+
+
+def convert_scaler(path_joblib: str) -> str:
+    """
+    StandardScaler か MinMaxScaler を mean, scale, var だけの npz にする。
+    どちらも transform(x) = (x - mean) / scale の形に揃える。
+    """
+    scaler = joblib.load(path_joblib)
+    # StandardScaler: (x - mean_) / scale_
+    if hasattr(scaler, 'mean_'):
+        mean, scale, var = scaler.mean_, scaler.scale_, scaler.var_
+    # MinMaxScaler: x * scale_ + min_
+    elif hasattr(scaler, 'min_'):
+        mean, scale = -scaler.min_ / scaler.scale_, 1 / scaler.scale_
+        # MinMaxScaler には var_ が無いので形を揃えるためだけに入れておく
+        var = scale ** 2
+    else:
+        raise ValueError(f'Unsupported scaler type: {type(scaler)}')
+    path_out = splitext(path_joblib)[0] + '.npz'
+    np.savez(path_out, mean=mean, scale=scale, var=var)
+    return path_out
+
+
+def main():
+    """
+    モデルと統計量のフォルダを指定して全部変換する。
+    """
+    model_dir = input('Please input model directory (ex: exp/unnamed)\n>>> ').strip('"')
+    for typ in ('timelag', 'duration', 'acoustic'):
+        for path_pth in glob(join(model_dir, typ, '*.pth')):
+            print(f'Converting: {path_pth}')
+            path_out = convert_checkpoint(path_pth)
+            print(f'  -> {path_out}')
+    stats_dir = input('Please input stats directory (ex: dump/unnamed/norm)\n>>> ').strip('"')
+    for path_joblib in glob(join(stats_dir, '*_scaler.joblib')):
+        print(f'Converting: {path_joblib}')
+        path_out = convert_scaler(path_joblib)
+        print(f'  -> {path_out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 oatsu
+"""
+学習済みモデルを ONNX 形式で出力する。
+enuconfig.yaml で onnx_runtime: true にすると、hts2wav で ONNX Runtime を使って推論する。
+変換後のファイルはチェックポイントと同じフォルダに出力する。
+"""
+from os import chdir
+from os.path import dirname, splitext
+
+import torch
+from nnsvs.bin.synthesis import maybe_set_normalization_stats_
+from omegaconf import DictConfig, OmegaConf
+
+from hts2wav import load_model_files, maybe_set_checkpoints_
+
+
+def export_onnx(model: torch.nn.Module, in_dim: int, path_out: str):
+    """
+    入力の長さ T を可変にして ONNX 形式で出力する。
+    lengths も入力にして、パディング処理が定数にならないようにする。
+    """
+    x = torch.zeros(1, 100, in_dim)
+    lengths = torch.tensor([100], dtype=torch.int64)
+    # 出力の数を数える (MDN のときは複数)
+    with torch.no_grad():
+        outputs = model(x, lengths)
+    num_outputs = 1 if isinstance(outputs, torch.Tensor) else len(outputs)
+    output_names = [f'out{i}' for i in range(num_outputs)]
+    dynamic_axes = {name: {1: 'T'} for name in ['x'] + output_names}
+    torch.onnx.export(model, (x, lengths), path_out,
+                      input_names=['x', 'lengths'],
+                      output_names=output_names,
+                      dynamic_axes=dynamic_axes,
+                      opset_version=17)
+
+
+def main():
+    """
+    enuconfig.yaml を指定して、3モデルを ONNX 形式で出力する。
+    """
+    path_enuconfig = input('Please input enuconfig.yaml path\n>>> ').strip('"')
+    config = DictConfig(OmegaConf.load(path_enuconfig))
+    # パスは音源フォルダからの相対パスで書かれている
+    chdir(dirname(path_enuconfig) or '.')
+    maybe_set_checkpoints_(config)
+    maybe_set_normalization_stats_(config)
+
+    for typ in ('timelag', 'duration', 'acoustic'):
+        model, model_config, _, _ = load_model_files(
+            config.model_dir, typ, 'cpu', False, False,
+            config[typ].checkpoint, config[typ].in_scaler_path, config[typ].out_scaler_path)
+        path_out = splitext(config[typ].checkpoint)[0] + '.onnx'
+        print(f'Exporting: {path_out}')
+        export_onnx(model, model_config.netG.in_dim, path_out)
+
+
+if __name__ == '__main__':
+    main()
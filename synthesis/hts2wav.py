@@ -32,9 +32,16 @@ nnsvs.bin.synthesis を改変した。
 #
 # ---------------------------------------------------------------------------------
 
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from datetime import datetime
-from os.path import join, relpath, split, splitext
+from functools import lru_cache
+from os import cpu_count
+from os.path import abspath, dirname, exists, getmtime, join, relpath, split, splitext
 from sys import argv
+from typing import NamedTuple
 
 import hydra
 import joblib
@@ -48,7 +55,18 @@ from nnsvs.gen import (postprocess_duration, predict_acoustic,
 from nnsvs.logger import getLogger
 from nnsvs_gen_override import gen_waveform
 from omegaconf import DictConfig, OmegaConf
-from scipy.io import wavfile
+
+try:
+    from numba import njit, prange
+except ModuleNotFoundError:
+    njit = None
+
+# soundfile が無い環境 (古い同梱Pythonなど) では scipy で書き出す
+try:
+    import soundfile as sf
+except ModuleNotFoundError:
+    sf = None
+    from scipy.io import wavfile
 
 
 def maybe_set_checkpoints_(config: DictConfig):
@@ -60,19 +78,356 @@ def maybe_set_checkpoints_(config: DictConfig):
         # checkpoint of each model
         if config[typ].checkpoint is None:
             config[typ].checkpoint = join(model_dir, typ, 'best_loss.pth')
-        else:
+        # 同じconfigで2回以上呼ばれたときに二重に結合しないようにする
+        elif dirname(config[typ].checkpoint) != join(model_dir, typ):
             config[typ].checkpoint = join(model_dir, typ, config[typ].checkpoint)
 
 
-def estimate_bit_depth(wav: np.ndarray) -> str:
+def is_converted_file_usable(path_converted: str, path_original: str) -> bool:
+    """
+    変換済みファイルが存在し、変換元のファイルより新しいかどうかを判定する。
+    学習しなおして変換元が上書きされたときに古い変換済みファイルを使わないようにする。
+    """
+    if not exists(path_converted):
+        return False
+    if not exists(path_original):
+        return True
+    return getmtime(path_converted) >= getmtime(path_original)
+
+
+def load_checkpoint_(model, checkpoint_path: str, device: str):
+    """
+    チェックポイントを読み取って、モデルに重みを設定する。
+    同じ名前の .safetensors ファイルがチェックポイントより新しければ、そちらを優先して読み取る。
+    CPUに一度コピーせず、直接 device 上に展開する。
+    """
+    # safetensors に変換済みの場合
+    path_safetensors = splitext(checkpoint_path)[0] + '.safetensors'
+    if is_converted_file_usable(path_safetensors, checkpoint_path):
+        try:
+            from safetensors.torch import load_model
+        except ModuleNotFoundError:
+            pass
+        else:
+            load_model(model, path_safetensors, device=device)
+            return
+    # mmap と weights_only は新しいPyTorchでしか使えない
+    try:
+        state_dict = torch.load(checkpoint_path, map_location=device,
+                                mmap=True, weights_only=True)['state_dict']
+    except TypeError:
+        state_dict = torch.load(checkpoint_path, map_location=device)['state_dict']
+    # assign も新しいPyTorchでしか使えない
+    try:
+        model.load_state_dict(state_dict, assign=True)
+    except TypeError:
+        model.load_state_dict(state_dict)
+
+
+class NpScaler:
+    """
+    convert_model_files.py で npz に変換したスケーラー。
+    sklearn の StandardScaler / MinMaxScaler の代わりに使う。
+    transform(x) = (x - mean_) / scale_
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, var: np.ndarray):
+        self.mean_ = mean
+        self.scale_ = scale
+        # 分散が0の次元では scale_ は1で var_ は0なので、scale_ から計算せずに読み取った値を使う
+        self.var_ = var
+
+    def transform(self, x):
+        """
+        正規化する
+        """
+        return (x - self.mean_) / self.scale_
+
+    def inverse_transform(self, x):
+        """
+        正規化を戻す
+        """
+        return x * self.scale_ + self.mean_
+
+
+def load_scaler(scaler_path: str):
+    """
+    スケーラーを読み取る。
+    npz に変換済みで元のファイルより新しければそちらを使い、pickle の読み込みを省略する。
+    """
+    path_npz = splitext(scaler_path)[0] + '.npz'
+    if is_converted_file_usable(path_npz, scaler_path):
+        with np.load(path_npz) as npz:
+            # var を保存していない古い npz は使わない
+            if 'var' in npz:
+                return NpScaler(npz['mean'], npz['scale'], npz['var'])
+    return joblib.load(scaler_path)
+
+
+class ModelBundle(NamedTuple):
+    """
+    合成に使うモデルとその設定、スケーラーをまとめたもの。
+    synthesis() の引数と同じ順番で並べている。
+    """
+    timelag_model: torch.nn.Module
+    timelag_config: DictConfig
+    timelag_in_scaler: object
+    timelag_out_scaler: object
+    duration_model: torch.nn.Module
+    duration_config: DictConfig
+    duration_in_scaler: object
+    duration_out_scaler: object
+    acoustic_model: torch.nn.Module
+    acoustic_config: DictConfig
+    acoustic_in_scaler: object
+    acoustic_out_scaler: object
+
+
+class OnnxModelWrapper(torch.nn.Module):
+    """
+    export_onnx.py で出力した ONNX モデルを ONNX Runtime で推論する。
+    nnsvs の predict_* からは元のモデルと同じように呼び出せるようにしている。
+    """
+
+    def __init__(self, onnx_path: str, model: torch.nn.Module, device: str):
+        super().__init__()
+        import onnxruntime as ort  # pylint: disable=import-outside-toplevel
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ['CPUExecutionProvider']
+        if device == 'cuda':
+            providers.insert(0, 'CUDAExecutionProvider')
+        self.session = ort.InferenceSession(onnx_path, sess_options, providers=providers)
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.model = model
+
+    def forward(self, x, lengths=None):
+        """
+        元のモデルの forward の代わりに ONNX Runtime で推論する。
+        """
+        feeds = {'x': x.detach().cpu().numpy()}
+        # lengths を使わないモデルでは入力から消えている
+        if 'lengths' in self.input_names:
+            feeds['lengths'] = np.asarray(lengths, dtype=np.int64)
+        outputs = [torch.from_numpy(out).to(x.device)
+                   for out in self.session.run(None, feeds)]
+        if len(outputs) == 1:
+            return outputs[0]
+        return tuple(outputs)
+
+    def inference(self, x, lengths=None):
+        """
+        元のモデルの inference を使い、その中の forward だけ ONNX Runtime で推論する。
+        """
+        return type(self.model).inference(self, x, lengths)
+
+    def __getattr__(self, name):
+        # prediction_type などは元のモデルのものを使う
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            if name == 'model':
+                raise
+            return getattr(self.model, name)
+
+
+def compile_model_(model):
+    """
+    モデルの forward を torch.compile でコンパイルする。
+    model.inference などのメソッドから呼ばれる forward もコンパイル済みになるように、
+    モデル自体は置き換えずに forward だけを差し替える。
+    torch.compile が無い古いPyTorchでは何もしない。
+    """
+    if not hasattr(torch, 'compile'):
+        return
+    # 曲ごとに入力の長さが違うので dynamic にして再コンパイルを防ぐ
+    model.forward = torch.compile(model.forward, dynamic=True)
+
+
+def load_model_files(model_dir: str, typ: str, device: str,
+                     onnx_runtime: bool, compile_model: bool,
+                     checkpoint_path: str, in_scaler_path: str, out_scaler_path: str) -> tuple:
+    """
+    timelag, duration, acoustic のいずれかのモデルに関するファイルを読み取る。
+    model, model_config, in_scaler, out_scaler を返す。
+    onnx_runtime が True で、チェックポイントより新しい ONNX ファイルがあるときは ONNX Runtime で推論する。
+    compile_model が True のときは torch.compile でコンパイルする。
+    """
+    model_config = OmegaConf.load(join(model_dir, typ, 'model.yaml'))
+    model = hydra.utils.instantiate(model_config.netG).to(device)
+    load_checkpoint_(model, checkpoint_path, device)
+    in_scaler = load_scaler(in_scaler_path)
+    out_scaler = load_scaler(out_scaler_path)
+    model.eval()
+    # ONNX に変換済みであれば ONNX Runtime で推論する
+    path_onnx = splitext(checkpoint_path)[0] + '.onnx'
+    use_onnx = onnx_runtime and is_converted_file_usable(path_onnx, checkpoint_path)
+    if onnx_runtime and not use_onnx:
+        # hts2wav で getLogger(config.verbose) として設定したロガーを使う
+        logging.getLogger('nnsvs').warning(
+            'ONNX file is missing or older than the checkpoint, so PyTorch is used instead: %s',
+            path_onnx)
+    if use_onnx:
+        model = OnnxModelWrapper(path_onnx, model, device)
+    elif compile_model:
+        compile_model_(model)
+    return (model, model_config, in_scaler, out_scaler)
+
+
+@lru_cache(maxsize=2)
+def _load_all(model_dir: str, device: str, onnx_runtime: bool, compile_model: bool,
+              file_paths: tuple, mtimes: tuple) -> ModelBundle:  # pylint: disable=unused-argument
+    """
+    3モデル分のファイルを読み取る。
+    同じプロセス内で繰り返し合成するときに読み込みなおさないようにキャッシュする。
+    コンパイルしたモデルもキャッシュされるので、コンパイルは初回だけで済む。
+    file_paths は各モデルの (checkpoint, in_scaler_path, out_scaler_path) のタプル。
+    mtimes は読み取るファイルの更新時刻で、キャッシュのキーにだけ使う。
+    """
+    # 3モデルは互いに独立なので並列に読み取る。
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(load_model_files, model_dir, typ, device,
+                                   onnx_runtime, compile_model, *paths)
+                   for typ, paths in zip(('timelag', 'duration', 'acoustic'), file_paths)]
+        results = [future.result() for future in futures]
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    return ModelBundle(*results[0], *results[1], *results[2])
+
+
+def get_model_file_mtimes(model_dir: str, typ: str, checkpoint_path: str,
+                          in_scaler_path: str, out_scaler_path: str) -> tuple:
+    """
+    モデルの読み込みに使うファイル(変換済みのものを含む)の更新時刻を返す。
+    存在しないファイルは None にする。
+    """
+    paths = (join(model_dir, typ, 'model.yaml'),
+             checkpoint_path,
+             splitext(checkpoint_path)[0] + '.safetensors',
+             splitext(checkpoint_path)[0] + '.onnx',
+             in_scaler_path,
+             splitext(in_scaler_path)[0] + '.npz',
+             out_scaler_path,
+             splitext(out_scaler_path)[0] + '.npz')
+    return tuple(getmtime(path) if exists(path) else None for path in paths)
+
+
+def load_models(config: DictConfig, device: str) -> ModelBundle:
+    """
+    configファイルを参考に、合成に使うモデルを読み取る。
+    """
+    # 使用モデルの学習済みファイルのパスを設定する。
+    maybe_set_checkpoints_(config)
+    maybe_set_normalization_stats_(config)
+    # enunu.py は音源フォルダに移動してから呼ぶので、相対パスのままだと
+    # 別の音源でも同じキーになってしまう。絶対パスにしてからキャッシュのキーにする。
+    model_dir = abspath(config.model_dir)
+    file_paths = tuple(
+        (abspath(config[typ].checkpoint),
+         abspath(config[typ].in_scaler_path),
+         abspath(config[typ].out_scaler_path))
+        for typ in ('timelag', 'duration', 'acoustic'))
+    # 学習しなおしたり変換しなおしたりしたときに読みなおすよう、更新時刻もキーにする
+    mtimes = tuple(get_model_file_mtimes(model_dir, typ, *paths)
+                   for typ, paths in zip(('timelag', 'duration', 'acoustic'), file_paths))
+    return _load_all(model_dir, device, config.get('onnx_runtime', False),
+                     config.get('compile', False), file_paths, mtimes)
+
+
+def warmup(config: DictConfig) -> None:
+    """
+    モデルを事前に読み込んでおく。
+    サーバーなどで繰り返し合成する場合に、初回の合成を速くするために使う。
+    """
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    load_models(config, device)
+
+
+def set_num_threads_(config: DictConfig):
+    """
+    CPUで推論するときのPyTorchのスレッド数を設定する。
+    スレッドが多すぎるとかえって遅くなるので、指定がなければ最大8にする。
+    """
+    # hydra の compose で読んだ config は struct モードなので、キーが無くてもエラーにならない select を使う
+    num_threads = OmegaConf.select(config, 'num_threads')
+    if num_threads is None:
+        num_threads = min(8, cpu_count() or 1)
+    torch.set_num_threads(num_threads)
+    # 並列処理が始まった後は設定できないので、2回目以降の呼び出しでは無視する
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _peak_amplitude_numba(wav):
+        peak = 0.0
+        for i in prange(wav.shape[0]):  # pylint: disable=not-an-iterable
+            peak = max(peak, abs(wav[i]))
+        return peak
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _scale_to_float32_numba(wav, factor, wav_f32):
+        for i in prange(wav.shape[0]):  # pylint: disable=not-an-iterable
+            wav_f32[i] = wav[i] * factor
+
+
+@dataclass
+class SynthBuffers:
+    """
+    サーバーなどで繰り返し合成するときに使いまわす出力用のバッファ。
+    同時に複数の合成で共有しないこと。
+    """
+    wav_f32: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float32))
+
+    def get_wav_f32(self, shape: tuple) -> np.ndarray:
+        """
+        指定した形の 32bit float のバッファを返す。
+        足りなければ倍々に大きくして、確保しなおす回数を減らす。
+        """
+        size = int(np.prod(shape))
+        if self.wav_f32.size < size:
+            self.wav_f32 = np.empty(max(size, 2 * self.wav_f32.size), dtype=np.float32)
+        return self.wav_f32[:size].reshape(shape)
+
+
+def peak_amplitude(wav: np.ndarray) -> float:
+    """
+    音量の最大値(絶対値の最大値)を返す。
+    numba があれば1回の並列走査で求める。
+    """
+    if njit is not None and wav.ndim == 1:
+        return float(_peak_amplitude_numba(wav))
+    # np.abs(wav) の一時配列を作らないように、最小値と最大値から求める。
+    return float(max(np.max(wav), -np.min(wav)))
+
+
+def scale_to_float32(wav: np.ndarray, factor: float, out: np.ndarray = None) -> np.ndarray:
+    """
+    wav に factor を掛けて 32bit float にする。
+    掛け算と型変換を1回で済ませる。
+    out を渡すとそこに書き込む。
+    """
+    wav_f32 = np.empty(wav.shape, dtype=np.float32) if out is None else out
+    if njit is not None and wav.ndim == 1:
+        _scale_to_float32_numba(wav, factor, wav_f32)
+    else:
+        np.multiply(wav, factor, out=wav_f32)
+    return wav_f32
+
+
+def estimate_bit_depth(wav: np.ndarray, peak: float = None) -> str:
     """
     wavformのビット深度を判定する。
     16bitか32bit
     16bitの最大値: 32767
     32bitの最大値: 2147483647
+    音量の最大値 peak を計算済みであれば渡すと、wav の走査を省略する。
     """
     # 音量の最大値を取得
-    max_gain = np.max(np.abs(wav))
+    max_gain = peak_amplitude(wav) if peak is None else peak
     # 学習データのビット深度を推定(8388608=2^24)
     if max_gain > 8388608:
         return 'int32'
@@ -81,33 +436,61 @@ def estimate_bit_depth(wav: np.ndarray) -> str:
     return 'float'
 
 
-def generate_wav_file(config: DictConfig, wav, out_wav_path):
+def generate_wav_file(config: DictConfig, wav, out_wav_path, buffers: SynthBuffers = None):
     """
     ビット深度を指定してファイル出力(32bit float)
+    buffers を渡すと、32bit float に変換するときにそのバッファを使いまわす。
     """
-    # 出力された音量をもとに、学習に使ったビット深度を推定
-    training_data_bit_depth = estimate_bit_depth(wav)
+    # 学習データのビット深度が設定されていればそれを使う
+    # struct モードの config でもキーが無ければ None になるように select を使う
+    training_data_bit_depth = OmegaConf.select(config, 'acoustic.training_bit_depth')
+    peak = None
+    if training_data_bit_depth is None:
+        # 音量の最大値はビット深度の推定とノーマライズの両方に使うので1回だけ求める
+        peak = peak_amplitude(wav)
+        # 出力された音量をもとに、学習に使ったビット深度を推定
+        training_data_bit_depth = estimate_bit_depth(wav, peak)
     # print(training_data_bit_depth)
 
     # 16bitで学習したモデルの時
     if training_data_bit_depth == 'int16':
-        wav = wav / 32767
+        divisor = 32767.0
     # 32bitで学習したモデルの時
     elif training_data_bit_depth == 'int32':
-        wav = wav / 2147483647
+        divisor = 2147483647.0
     elif training_data_bit_depth == 'float':
-        pass
+        divisor = 1.0
     # なぜか16bitでも32bitでもないとき
     else:
         raise ValueError('WAVのbit深度がよくわかりませんでした。')
 
     # 音量ノーマライズする場合
+    # ビット深度で割ってから最大値で割るのと同じなので、最大値だけで割ればよい。
+    # 無音のときは0で割ってしまうのでノーマライズしない。
     if config.gain_normalize:
-        wav = wav / np.max(np.abs(wav))
+        if peak is None:
+            peak = peak_amplitude(wav)
+        if peak > 0:
+            divisor = peak
+
+    # 割り算と32bit float への変換を1回で済ませる
+    out = None if buffers is None else buffers.get_wav_f32(wav.shape)
+    wav_f32 = scale_to_float32(wav, 1.0 / divisor, out)
 
     # ファイル出力
-    wav = wav.astype(np.float32)
-    wavfile.write(out_wav_path, rate=config.sample_rate, data=wav)
+    if sf is not None:
+        sf.write(out_wav_path, wav_f32, config.sample_rate, subtype='FLOAT')
+    else:
+        wavfile.write(out_wav_path, rate=config.sample_rate, data=wav_f32)
+
+
+def write_binary_file(array: np.ndarray, path: str):
+    """
+    f0, mgc, bap などを 64bit float のバイナリファイルとして出力する。
+    """
+    # すでに 64bit float のときはコピーせずにそのまま書き込む
+    with open(path, 'wb') as f:
+        array.astype(np.float64, copy=False).tofile(f)
 
 
 def set_each_question_path(config: DictConfig):
@@ -122,10 +505,11 @@ def set_each_question_path(config: DictConfig):
             config[typ].question_path = config[typ].question_path
 
 
-def load_qst(question_path, append_hat_for_LL=False) -> tuple:
+@lru_cache(maxsize=8)
+def _load_qst_cached(question_path: str, mtime: float, append_hat_for_LL: bool) -> tuple:
     """
-    question.hed ファイルを読み取って、
-    binary_dict, continuous_dict, pitch_idx, pitch_indices を返す。
+    question.hed ファイルを読み取る。
+    絶対パスとファイルの更新時刻をキーにして、別の音源の同名ファイルや書き換えられたファイルを区別する。
     """
     binary_dict, continuous_dict = hts.load_question_set(
         question_path, append_hat_for_LL=append_hat_for_LL)
@@ -134,6 +518,60 @@ def load_qst(question_path, append_hat_for_LL=False) -> tuple:
     return (binary_dict, continuous_dict, pitch_indices, pitch_idx)
 
 
+def load_qst(question_path, append_hat_for_LL=False) -> tuple:
+    """
+    question.hed ファイルを読み取って、
+    binary_dict, continuous_dict, pitch_idx, pitch_indices を返す。
+    3モデルで同じファイルを使うことが多いので、読み取り結果をキャッシュする。
+    返り値は共有されるので書き換えないこと。
+    """
+    question_path = abspath(question_path)
+    return _load_qst_cached(question_path, getmtime(question_path), append_hat_for_LL)
+
+
+@lru_cache(maxsize=32)
+def _load_label_cached(label_path: str, mtime: float):
+    """
+    ラベルファイルを読み取る。
+    絶対パスとファイルの更新時刻をキーにして、別のフォルダの同名ファイルや書き換えられたファイルを区別する。
+    """
+    return hts.load(label_path).round_()
+
+
+def load_label(label_path: str):
+    """
+    ラベルファイルを読み取る。
+    同じプロセスで同じファイルを繰り返し合成するときはキャッシュを使う。
+    返り値は共有されるので書き換えないこと。
+    """
+    label_path = abspath(label_path)
+    return _load_label_cached(label_path, getmtime(label_path))
+
+
+def inference_mode():
+    """
+    torch.inference_mode を返す。
+    古いPyTorchには無いので、その場合は torch.no_grad で代用する。
+    """
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+def autocast(device: str, enabled: bool):
+    """
+    半精度(float16)で推論するためのコンテキストマネージャを返す。
+    CUDAのときだけ有効にする。
+    CPUの bfloat16 は nnsvs が出力を numpy に変換するときにエラーになるので使わない。
+    """
+    if not enabled or device != 'cuda':
+        return nullcontext()
+    # torch.autocast は PyTorch 1.10 以降。torch.cuda.amp.autocast は非推奨なので古いときだけ使う。
+    if hasattr(torch, 'autocast'):
+        return torch.autocast('cuda', dtype=torch.float16)
+    return torch.cuda.amp.autocast()
+
+
 def synthesis(config, device, label_path,
               timelag_model, timelag_config, timelag_in_scaler, timelag_out_scaler,
               duration_model, duration_config, duration_in_scaler, duration_out_scaler,
@@ -142,61 +580,77 @@ def synthesis(config, device, label_path,
     音声ファイルを合成する。
     """
     # load labels and question
-    labels = hts.load(label_path).round_()
+    labels = load_label(label_path)
     # load questions
     set_each_question_path(config)
+    # OmegaConf の属性アクセスは遅いので、使う値を先にまとめて取り出しておく
     log_f0_conditioning = config.log_f0_conditioning
-
-    if config.ground_truth_duration:
-        # Use provided alignment
-        duration_modified_labels = labels
-    else:
-        # Time-lag predictions
-        timelag_binary_dict, timelag_continuous_dict, timelag_pitch_indices, _ \
-            = load_qst(config.timelag.question_path)
-        lag = predict_timelag(
-            device, labels,
-            timelag_model,
-            timelag_config,
-            timelag_in_scaler,
-            timelag_out_scaler,
-            timelag_binary_dict,
-            timelag_continuous_dict,
-            timelag_pitch_indices,
-            log_f0_conditioning,
-            config.timelag.allowed_range)
-
-        # Duration predictions
-        duration_binary_dict, duration_continuous_dict, duration_pitch_indices, _ \
-            = load_qst(config.duration.question_path)
-        durations = predict_duration(
-            device, labels,
-            duration_model,
-            duration_config,
-            duration_in_scaler,
-            duration_out_scaler,
-            lag,
-            duration_binary_dict,
-            duration_continuous_dict,
-            duration_pitch_indices,
-            log_f0_conditioning)
-        # Normalize phoneme durations
-        duration_modified_labels = postprocess_duration(labels, durations, lag)
-
-    acoustic_binary_dict, acoustic_continuous_dict, acoustic_pitch_indices, acoustic_pitch_idx \
-        = load_qst(config.acoustic.question_path)
-    # Predict acoustic features
-    acoustic_features = predict_acoustic(
-        device, duration_modified_labels,
-        acoustic_model,
-        acoustic_config,
-        acoustic_in_scaler,
-        acoustic_out_scaler,
-        acoustic_binary_dict,
-        acoustic_continuous_dict,
-        config.acoustic.subphone_features,
-        acoustic_pitch_indices,
-        log_f0_conditioning)
+    ground_truth_duration = config.ground_truth_duration
+    fp16 = config.get('fp16', False)
+    timelag_question_path = config.timelag.question_path
+    timelag_allowed_range = config.timelag.allowed_range
+    duration_question_path = config.duration.question_path
+    acoustic_question_path = config.acoustic.question_path
+    subphone_features = config.acoustic.subphone_features
+    post_filter = config.acoustic.post_filter
+    relative_f0 = config.acoustic.relative_f0
+    sample_rate = config.sample_rate
+    frame_period = config.frame_period
+
+    # 推論時は勾配計算を省略する
+    with inference_mode():
+        if ground_truth_duration:
+            # Use provided alignment
+            duration_modified_labels = labels
+        else:
+            # Time-lag predictions
+            timelag_binary_dict, timelag_continuous_dict, timelag_pitch_indices, _ \
+                = load_qst(timelag_question_path)
+            lag = predict_timelag(
+                device, labels,
+                timelag_model,
+                timelag_config,
+                timelag_in_scaler,
+                timelag_out_scaler,
+                timelag_binary_dict,
+                timelag_continuous_dict,
+                timelag_pitch_indices,
+                log_f0_conditioning,
+                timelag_allowed_range)
+
+            # Duration predictions
+            duration_binary_dict, duration_continuous_dict, duration_pitch_indices, _ \
+                = load_qst(duration_question_path)
+            durations = predict_duration(
+                device, labels,
+                duration_model,
+                duration_config,
+                duration_in_scaler,
+                duration_out_scaler,
+                lag,
+                duration_binary_dict,
+                duration_continuous_dict,
+                duration_pitch_indices,
+                log_f0_conditioning)
+            # Normalize phoneme durations
+            duration_modified_labels = postprocess_duration(labels, durations, lag)
+
+        acoustic_binary_dict, acoustic_continuous_dict, acoustic_pitch_indices, acoustic_pitch_idx \
+            = load_qst(acoustic_question_path)
+        # Predict acoustic features
+        # 計算量が一番多いので、設定されていれば半精度で推論する
+        with autocast(device, fp16):
+            acoustic_features = predict_acoustic(
+                device, duration_modified_labels,
+                acoustic_model,
+                acoustic_config,
+                acoustic_in_scaler,
+                acoustic_out_scaler,
+                acoustic_binary_dict,
+                acoustic_continuous_dict,
+                subphone_features,
+                acoustic_pitch_indices,
+                log_f0_conditioning)
 
     # Generate f0, mgc, bap, waveform
     f0, mgc, bap, generated_waveform = gen_waveform(
@@ -206,19 +660,20 @@ def synthesis(config, device, label_path,
         acoustic_continuous_dict,
         acoustic_config.stream_sizes,
         acoustic_config.has_dynamic_features,
-        config.acoustic.subphone_features,
+        subphone_features,
         log_f0_conditioning,
         acoustic_pitch_idx,
         acoustic_config.num_windows,
-        config.acoustic.post_filter,
-        config.sample_rate,
-        config.frame_period,
-        config.acoustic.relative_f0)
+        post_filter,
+        sample_rate,
+        frame_period,
+        relative_f0)
 
     return duration_modified_labels, f0, mgc, bap, generated_waveform
 
 
-def hts2wav(config: DictConfig, label_path: str = None, out_wav_path: str = None) -> None:
+def hts2wav(config: DictConfig, label_path: str = None, out_wav_path: str = None,
+            buffers: SynthBuffers = None) -> None:
     """
     configファイルから各種設定を取得し、labファイルをもとにWAVファイルを生成する。
 
@@ -226,51 +681,24 @@ def hts2wav(config: DictConfig, label_path: str = None, out_wav_path: str = None
         - ビット深度指定をできるようにした。
         - utt_list を使わず単一ファイルのみにした。
         - 単一ファイルのときの音量ノーマライズを無効にした。
+
+    繰り返し合成するときは SynthBuffers を渡すと出力用のバッファを使いまわす。
     """
     logger = getLogger(config.verbose)
-    logger.info(OmegaConf.to_yaml(config))
+    # 表示されないときはYAMLへの変換を省略する
+    if logger.isEnabledFor(logging.INFO):
+        logger.info('%s', OmegaConf.to_yaml(config))
 
     # GPUのCUDAが使えるかどうかを判定
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
-
-    # 使用モデルの学習済みファイルのパスを設定する。
-    maybe_set_checkpoints_(config)
-    maybe_set_normalization_stats_(config)
+    # CPUで推論するときはスレッド数を設定する
+    if device == 'cpu':
+        set_num_threads_(config)
 
     # モデルに関するファイルを読み取る。
-    model_root = config.model_dir
-    # timelag
-    timelag_config = OmegaConf.load(join(model_root, "timelag", "model.yaml"))
-    timelag_model = hydra.utils.instantiate(timelag_config.netG).to(device)
-    checkpoint = torch.load(config.timelag.checkpoint,
-                            map_location=lambda storage,
-                            loc: storage)
-    timelag_model.load_state_dict(checkpoint['state_dict'])
-    timelag_in_scaler = joblib.load(config.timelag.in_scaler_path)
-    timelag_out_scaler = joblib.load(config.timelag.out_scaler_path)
-    timelag_model.eval()
-
-    # duration
-    duration_config = OmegaConf.load(join(model_root, "duration", "model.yaml"))
-    duration_model = hydra.utils.instantiate(duration_config.netG).to(device)
-    checkpoint = torch.load(config.duration.checkpoint,
-                            map_location=lambda storage,
-                            loc: storage)
-    duration_model.load_state_dict(checkpoint['state_dict'])
-    duration_in_scaler = joblib.load(config.duration.in_scaler_path)
-    duration_out_scaler = joblib.load(config.duration.out_scaler_path)
-    duration_model.eval()
-
-    # acoustic model
-    acoustic_config = OmegaConf.load(join(model_root, "acoustic", "model.yaml"))
-    acoustic_model = hydra.utils.instantiate(acoustic_config.netG).to(device)
-    checkpoint = torch.load(config.acoustic.checkpoint,
-                            map_location=lambda storage,
-                            loc: storage)
-    acoustic_model.load_state_dict(checkpoint['state_dict'])
-    acoustic_in_scaler = joblib.load(config.acoustic.in_scaler_path)
-    acoustic_out_scaler = joblib.load(config.acoustic.out_scaler_path)
-    acoustic_model.eval()
+    models = load_models(config, device)
+    # 推論しかしないので勾配計算を無効にする
+    torch.set_grad_enabled(False)
 
     # 設定を表示
     # print(OmegaConf.to_yaml(config))
@@ -290,28 +718,26 @@ def hts2wav(config: DictConfig, label_path: str = None, out_wav_path: str = None
     # パラメータ推定
     logger.info('Synthesize the wav file: %s', out_wav_path)
     duration_modified_labels, f0, sp, bap, wav = synthesis(
-        config, device, label_path,
-        timelag_model, timelag_config, timelag_in_scaler, timelag_out_scaler,
-        duration_model, duration_config, duration_in_scaler, duration_out_scaler,
-        acoustic_model, acoustic_config, acoustic_in_scaler, acoustic_out_scaler)
+        config, device, label_path, *models)
 
     # 中間ファイル出力
     with open(out_wav_path.replace('.wav', '_timing.lab'), 'wt') as f_lab:
-        lines = str(duration_modified_labels).splitlines()
-        s = ''
-        for line in lines:
-            t_start, t_end, context = line.split()
-            context = context[context.find('-') + 1: context.find('+')]
-            s += f'{t_start} {t_end} {context}\n'
-        f_lab.write(s)
-    with open(out_wav_path.replace('.wav', '.f0'), 'wb') as f_f0:
-        f0.astype(np.float64).tofile(f_f0)
-    with open(out_wav_path.replace('.wav', '.mgc'), 'wb') as f_mgc:
-        sp.astype(np.float64).tofile(f_mgc)
-    with open(out_wav_path.replace('.wav', '.bap'), 'wb') as f_bap:
-        bap.astype(np.float64).tofile(f_bap)
-    # サンプルレートとビット深度を指定してWAVファイル出力
-    generate_wav_file(config, wav, out_wav_path)
+        for t_start, t_end, context in zip(duration_modified_labels.start_times,
+                                           duration_modified_labels.end_times,
+                                           duration_modified_labels.contexts):
+            phoneme = context[context.find('-') + 1: context.find('+')]
+            f_lab.write(f'{t_start} {t_end} {phoneme}\n')
+    # f0, mgc, bap, wav のファイル出力は互いに独立なので並列に書き込む。
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(write_binary_file, f0, out_wav_path.replace('.wav', '.f0')),
+            executor.submit(write_binary_file, sp, out_wav_path.replace('.wav', '.mgc')),
+            executor.submit(write_binary_file, bap, out_wav_path.replace('.wav', '.bap')),
+            # サンプルレートとビット深度を指定してWAVファイル出力
+            executor.submit(generate_wav_file, config, wav, out_wav_path, buffers)
+        ]
+        for future in futures:
+            future.result()
 
     logger.info('Synthesized the wav file: %s', out_wav_path)
 